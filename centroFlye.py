@@ -181,7 +181,8 @@ class CentroFlye:
                     "--bottom", self.params.bottom,
                     "--top", self.params.top,
                     "--kmer-survival-rate", self.params.kmer_survival_rate,
-                    "--max-nonuniq", self.params.max_nonuniq]
+                    "--max-nonuniq", self.params.max_nonuniq,
+                    "--threads", self.params.threads]
         recr_cmd = listEls2str(recr_cmd)
         print("Running unique kmer recruitment")
         print(list2str(recr_cmd))
@@ -8,7 +8,7 @@ import os
 from debruijn_graph import iterative_graph, scaffolding, read2scaffolds,\
                            cover_scaffolds_w_reads, extract_read_pseudounits, \
                            polish
-from sd_parser import SD_Report
+from sd_parser import load_sd_report
 from mono_error_correction import error_correction
 
 from utils.os_utils import smart_makedirs
@@ -49,6 +49,9 @@ def parse_args():
                         help='Number of iterations of Flye polishing',
                         type=int,
                         default=50)
+    parser.add_argument('--no-cache',
+                        help='Do not cache the parsed SD report',
+                        action='store_true')
     params = parser.parse_args()
     return params
 
@@ -58,8 +61,11 @@ def main():
     smart_makedirs(params.outdir)
 
     print('Reading report')
-    sd_report = SD_Report(SD_report_fn=params.sd_report,
-                          monomers_fn=params.monomers)
+    cachedir = None if params.no_cache \
+        else os.path.join(params.outdir, '.joblib_cache')
+    sd_report = load_sd_report(SD_report_fn=params.sd_report,
+                               monomers_fn=params.monomers,
+                               cachedir=cachedir)
 
     print('Error correcting monoreads')
     ec_monostrings = error_correction(sd_report.monostrings,
@@ -29,7 +29,7 @@ class CloudContig:
         for i, cloud in enumerate(read_kmer_clouds.kmers):
             self.coverage[i + position] += 1
             self.clouds[i + position]
-            for kmer in cloud:
+            for kmer in cloud.tolist():
                 self.kmer_positions[kmer].add(i+position)
                 self.clouds[i+position][kmer] += 1
                 if self.clouds[i+position][kmer] == self.min_cloud_kmer_freq:
@@ -41,7 +41,8 @@ class CloudContig:
         return new_freq_kmers
 
     def calc_rough_inters_score(self, read_kmer_cloud):
-        return len(read_kmer_cloud.all_kmers & self.freq_kmers)
+        return len(self.freq_kmers.intersection(
+            read_kmer_cloud.all_kmers.tolist()))
 
     def calc_inters_score(self, read_kmer_cloud,
                           min_position=0, max_position=None,
@@ -50,20 +51,37 @@ class CloudContig:
         if max_position is None:
             max_position = self.max_pos
         best_score, best_pos = (0, 0), None
-        kmers = read_kmer_cloud.kmers
+        kmers = [set(cloud.tolist()) for cloud in read_kmer_cloud.kmers]
+        # max_inters[i] bounds the intersections clouds i, i+1, ... can add
+        max_inters = [0] * (len(kmers) + 1)
+        for i in range(len(kmers) - 1, -1, -1):
+            max_inters[i] = max_inters[i + 1] + len(kmers[i])
         positions = [pos for pos in range(min_position, max_position + 1)]
         for pos in positions:
             score = [0, 0]
             max_i = min(self.max_pos-pos+1, len(kmers))
+            pruned = False
             for i in range(max_i):
                 assert pos + i <= self.max_pos
                 freq_cloud = self.freq_clouds[pos + i]
-                inters = freq_cloud & set(kmers[i])
+                inters = freq_cloud & kmers[i]
                 if verbose:
                     print(pos, i, inters, len(inters),
                           len(freq_cloud), len(kmers[i]))
                 score[0] += len(inters) >= 1
                 score[1] += len(inters)
+                if not verbose:
+                    # stop once the rest of the read cannot make pos valid
+                    # or at least as good as best_pos
+                    bound = (score[0] + max_i - i - 1,
+                             score[1] + max_inters[i + 1])
+                    if bound[0] < min_unit or \
+                            bound[1] < min_inters or \
+                            bound < best_score:
+                        pruned = True
+                        break
+            if pruned:
+                continue
             if verbose:
                 print(f'pos: {pos}, i: {i}, score: {score}')
             score = tuple(score)
@@ -84,7 +102,8 @@ class CloudContig:
         return set(kmers)
 
 
-def update_mapping_scores(cloud_contig, kmers2pos, freq_kmers, scores=None):
+def update_mapping_scores(cloud_contig, kmers2pos, freq_kmers, scores=None,
+                          updated_reads=None):
     if scores is None:
         scores = defaultdict(lambda: defaultdict(Counter))
     for kmer, cc_kmer_pos in freq_kmers:
@@ -92,6 +111,8 @@ def update_mapping_scores(cloud_contig, kmers2pos, freq_kmers, scores=None):
             for r_id, pos in kmers2pos[kmer]:
                 if cc_kmer_pos >= pos:
                     scores[r_id][cc_kmer_pos-pos][pos] += 1
+                    if updated_reads is not None:
+                        updated_reads.add(r_id)
     return scores
 
 
@@ -119,7 +140,7 @@ def map_reads_fast(cloud_contig, reads_kmer_clouds,
     kmers2pos = defaultdict(list)
     for r_id, kmer_clouds in reads_kmer_clouds.items():
         for i, cloud in enumerate(kmer_clouds.kmers):
-            for kmer in cloud:
+            for kmer in cloud.tolist():
                 kmers2pos[kmer].append((r_id, i))
 
     freq_kmers = []
@@ -5,8 +5,14 @@
 import argparse
 import os
 import itertools
+import math
 import sys
-from collections import defaultdict
+
+import numpy as np
+from joblib import Parallel, delayed
+
+from kmer_count_nb import count_cloud_pairs, count_kmers, decode_kmer, \
+    encode_seq, kmer_len, SaturatingKmerCounter
 from utils.os_utils import smart_makedirs
 from ncrf_parser import NCRF_Report
 from read_kmer_cloud import get_reads_kmer_clouds
@@ -22,7 +28,7 @@ def parse_args():
                         type=int,
                         default=4)
     parser.add_argument('--outdir', help='Output directory', required=True)
-    parser.add_argument('-k', type=int, default=19)
+    parser.add_argument('-k', type=kmer_len, default=19)
     parser.add_argument('--min-nreads', type=int, default=0)
     parser.add_argument('--max-nreads', type=int, default=sys.maxsize)
     parser.add_argument('--min-distance', type=int, default=1)
@@ -31,6 +37,8 @@ def parse_args():
     parser.add_argument('--top', type=float, default=3.)
     parser.add_argument('--kmer-survival-rate', type=float, default=0.34)
     parser.add_argument('--max-nonuniq', type=int, default=3)
+    parser.add_argument('--threads', help='Number of threads',
+                        type=int, default=1)
     parser.add_argument('--verbose', action='store_true', default=True)
     params = parser.parse_args()
     return params
@@ -38,122 +46,141 @@ def parse_args():
 
 def get_kmer_freqs_from_ncrf_report(reads_ncrf_report,
                                     k, verbose,
-                                    max_nonuniq):
-    non_unique_freqs = defaultdict(int)
-    all_kmers = defaultdict(int)
+                                    max_nonuniq,
+                                    max_freq=255,
+                                    batch_size=1000):
+    # frequency of a kmer is the number of reads it occurs in (saturated at
+    # max_freq); kmers that are non-unique in more than max_nonuniq reads
+    # are discarded
+    read_counter = SaturatingKmerCounter(max_count=max_freq)
+    nonuniq_counter = SaturatingKmerCounter(max_count=max_nonuniq + 1)
     for i, (r_id, record) in enumerate(reads_ncrf_report.records.items()):
         if i % 100 == 0 and verbose:
             print(i + 1, len(reads_ncrf_report.records))
         r_al = record.r_al
         r_al = r_al.replace('-', '')
 
-        read_freq = defaultdict(int)
-        for i in range(len(r_al)-k+1):
-            kmer = r_al[i:i+k]
-            read_freq[kmer] += 1
+        kmers, freqs = count_kmers(encode_seq(r_al), k)
+        read_counter.add(kmers)
+        nonuniq_counter.add(kmers[freqs > 1])
+        if (i + 1) % batch_size == 0:
+            read_counter.flush()
+            nonuniq_counter.flush()
+    read_counter.flush()
+    nonuniq_counter.flush()
 
-        for kmer, freq in read_freq.items():
-            if freq > 1:
-                non_unique_freqs[kmer] += 1
-            if non_unique_freqs[kmer] <= max_nonuniq:
-                all_kmers[kmer] += 1
-            else:
-                if kmer in all_kmers:
-                    del all_kmers[kmer]
-    return all_kmers
+    discarded_kmers = \
+        nonuniq_counter.kmers[nonuniq_counter.counts > max_nonuniq]
+    kept = ~np.isin(read_counter.kmers, discarded_kmers, assume_unique=True)
+    return read_counter.kmers[kept], read_counter.counts[kept]
 
 
 def get_rare_kmers(reads_ncrf_report, k,
                    bottom, top, coverage, kmer_survival_rate, max_nonuniq,
                    verbose):
-    all_kmers = get_kmer_freqs_from_ncrf_report(reads_ncrf_report,
-                                                k=k,
-                                                verbose=verbose,
-                                                max_nonuniq=max_nonuniq)
-
     left = bottom*coverage*kmer_survival_rate
     right = top*coverage*kmer_survival_rate
 
-    rare_kmers = [kmer for kmer, freq in all_kmers.items()
-                  if left <= freq <= right]
-    rare_kmers = set(rare_kmers)
+    all_kmers, all_freqs = \
+        get_kmer_freqs_from_ncrf_report(reads_ncrf_report,
+                                        k=k,
+                                        verbose=verbose,
+                                        max_nonuniq=max_nonuniq,
+                                        max_freq=math.floor(right) + 1)
+
+    rare_kmers = all_kmers[(left <= all_freqs) & (all_freqs <= right)]
     if verbose:
         print(f'# rare kmers: {len(rare_kmers)}')
     return rare_kmers
 
 
+def get_dist_cnts(cloud_kmers, cloud_offsets, read_offsets, dists, nkmers):
+    # memmapped arrays are passed to numba as plain ndarrays
+    cloud_kmers = np.asarray(cloud_kmers)
+    cloud_offsets = np.asarray(cloud_offsets)
+    read_offsets = np.asarray(read_offsets)
+    return [count_cloud_pairs(cloud_kmers, cloud_offsets, read_offsets,
+                              dist=dist, nkmers=nkmers)
+            for dist in dists]
+
+
 def get_kmer_dist_map(reads_kmer_clouds, kmers,
                       min_n, max_n,
                       min_d, max_d,
-                      verbose):
+                      verbose, n_threads=1):
     def index_clouds(reads_kmer_clouds, min_n, max_n):
-        indexed_reads_kmer_clouds = {}
+        # clouds are flattened into arrays of kmer indexes and offsets so
+        # that joblib memmaps them for the workers instead of pickling
+        clouds, read_nclouds = [], []
         for r_id, kmer_clouds in \
                 itertools.islice(reads_kmer_clouds.items(), min_n, max_n):
-            kmers = kmer_clouds.kmers
-            indexed_read_kmer_clouds = []
-            for cloud in kmers:
-                indexed_cloud = [kmer_index[kmer] for kmer in cloud]
-                indexed_read_kmer_clouds.append(indexed_cloud)
-            indexed_reads_kmer_clouds[r_id] = indexed_read_kmer_clouds
-        return indexed_reads_kmer_clouds
+            clouds += kmer_clouds.kmers
+            read_nclouds.append(len(kmer_clouds.kmers))
+        cloud_kmers = \
+            np.concatenate([np.empty(0, dtype=np.int64)] + clouds)
+        cloud_kmers = np.searchsorted(kmers, cloud_kmers)
+        cloud_offsets = np.cumsum([0] + [len(cloud) for cloud in clouds])
+        read_offsets = np.cumsum([0] + read_nclouds)
+        return cloud_kmers, cloud_offsets, read_offsets
 
     if verbose:
         print("Indexing")
-    kmer_index = {kmer: i for i, kmer in enumerate(kmers)}
-    indexed_reads_kmer_clouds = index_clouds(reads_kmer_clouds, min_n, max_n)
+    kmer_index = {kmer: i for i, kmer in enumerate(kmers.tolist())}
+    cloud_kmers, cloud_offsets, read_offsets = \
+        index_clouds(reads_kmer_clouds, min_n, max_n)
 
     if verbose:
         print("Inferring distances")
-    dist_cnt = {dist: [defaultdict(int) for i in range(len(kmers))] \
-                for dist in range(min_d, max_d + 1)}
-
-    for dist in range(min_d, max_d + 1):
-        # dist_cnt[dist] = [defaultdict(int) for i in range(len(kmers))]
-        dt = dist_cnt[dist]
-        for n, (r_id, kmer_clouds) in \
-                enumerate(indexed_reads_kmer_clouds.items()):
-            if verbose:
-                print(dist,
-                      n + min_n,
-                      len(kmer_clouds),
-                      len(indexed_reads_kmer_clouds.items()) + min_n)
-            for i, i_cloud in enumerate(kmer_clouds[:-dist]):
-                j_cloud = kmer_clouds[i+dist]
-                for i_index in i_cloud:
-                    for j_index in j_cloud:
-                        # assert i_index != j_index
-                        if i_index != j_index:
-                            dt[i_index][j_index] += 1
+    # one batch of distances per worker; batches are interleaved since
+    # short distances have more pairs
+    dists = list(range(min_d, max_d + 1))
+    n_batches = min(len(dists), n_threads)
+    dist_batches = [dists[i::n_batches] for i in range(n_batches)]
+    batch_dist_cnts = \
+        Parallel(n_jobs=n_threads, backend='loky', batch_size=1,
+                 verbose=10 if verbose else 0)(
+            delayed(get_dist_cnts)(cloud_kmers, cloud_offsets, read_offsets,
+                                   dists=dist_batch,
+                                   nkmers=len(kmers))
+            for dist_batch in dist_batches)
+    dist_cnt = {}
+    for dist_batch, dist_cnts in zip(dist_batches, batch_dist_cnts):
+        dist_cnt.update(zip(dist_batch, dist_cnts))
+    dist_cnt = {dist: dist_cnt[dist] for dist in dists}
     return dist_cnt, kmer_index
 
 
-def filter_dist_tuples(dist_cnt, min_coverage, rel_threshold=0.8):
-    candidate_edges = {}
-    for dist, dt in dist_cnt.items():
-        for i_index in range(len(dt)):
-            for j_index in dt[i_index]:
-                freq = dt[i_index][j_index]
-                if freq >= min_coverage:
-                    candidate_edges[(i_index, j_index, dist)] = freq
+def filter_dist_tuples(dist_cnt, nkmers, min_coverage, rel_threshold=0.8):
+    # dist_cnt maps a distance to sorted pair keys and their counts
+    if len(dist_cnt) == 0:
+        return set(), []
+    all_pairs, inverse = \
+        np.unique(np.concatenate([pairs for pairs, _ in dist_cnt.values()]),
+                  return_inverse=True)
+    all_occ = np.zeros(len(all_pairs), dtype=np.int64)
+    np.add.at(all_occ, inverse,
+              np.concatenate([counts for _, counts in dist_cnt.values()]))
 
     selected_kmers = []
     selected_edges = []
-    for (i_index, j_index, cand_dist), freq in candidate_edges.items():
-        all_occ = sum(dist_cnt[dist][i_index][j_index] for dist in dist_cnt)
-        if freq / all_occ >= rel_threshold:
+    for dist, (pairs, counts) in dist_cnt.items():
+        occ = all_occ[np.searchsorted(all_pairs, pairs)]
+        selected = (counts >= min_coverage) & (counts / occ >= rel_threshold)
+        for pair, freq in zip(pairs[selected].tolist(),
+                              counts[selected].tolist()):
+            i_index, j_index = divmod(pair, nkmers)
             selected_kmers.append(i_index)
             selected_kmers.append(j_index)
-            selected_edges.append((cand_dist, i_index, j_index, freq))
+            selected_edges.append((dist, i_index, j_index, freq))
     selected_kmers = set(selected_kmers)
     return selected_kmers, selected_edges
 
 
-def output_results(kmer_index, min_coverage,
+def output_results(kmer_index, k, min_coverage,
                    unique_kmers_ind, dist_edges, outdir):
     kmer_index_reversed = {}
     for kmer, index in kmer_index.items():
-        kmer_index_reversed[index] = kmer
+        kmer_index_reversed[index] = decode_kmer(kmer, k)
 
     kmers_out_fn = \
         os.path.join(outdir, f'unique_kmers_min_edge_cov_{min_coverage}.txt')
@@ -196,12 +223,16 @@ def main():
                                              max_n=params.max_nreads,
                                              min_d=params.min_distance,
                                              max_d=params.max_distance,
-                                             verbose=params.verbose)
+                                             verbose=params.verbose,
+                                             n_threads=params.threads)
 
     unique_kmers_ind, dist_edges = \
-        filter_dist_tuples(dist_cnt, min_coverage=params.min_coverage)
+        filter_dist_tuples(dist_cnt,
+                           nkmers=len(rare_kmers),
+                           min_coverage=params.min_coverage)
 
     output_results(kmer_index=kmer_index,
+                   k=params.k,
                    min_coverage=params.min_coverage,
                    unique_kmers_ind=unique_kmers_ind,
                    dist_edges=dist_edges,
@@ -9,6 +9,7 @@ import math
 import statistics
 import edlib
 from collections import defaultdict
+from joblib import Parallel, delayed
 from utils.os_utils import smart_makedirs
 from ncrf_parser import NCRF_Report
 from utils.bio import write_bio_seqs, read_bio_seq, compress_homopolymer
@@ -97,9 +98,7 @@ class ELTR_Polisher:
         return filenames
 
     def run_polishing(self, read_unit_filenames):
-        min_pos = min(read_unit_filenames.keys())
-        max_pos = max(read_unit_filenames.keys())
-        for pos in range(min_pos, max_pos + 1):
+        def polish_pos(pos):
             print(pos, max_pos)
             units_fn, median_read_unit_fn = read_unit_filenames[pos]
             pos_dir = os.path.dirname(units_fn)
@@ -107,12 +106,19 @@ class ELTR_Polisher:
                    f'--{self.params.error_mode}-raw', units_fn,
                    '--polish-target', median_read_unit_fn,
                    '-i', self.params.num_iters,
-                   '-t', self.params.num_threads,
+                   '-t', 1,
                    '-o', pos_dir]
             cmd = [str(x) for x in cmd]
             print(' '.join(cmd))
             subprocess.check_call(cmd)
 
+        min_pos = min(read_unit_filenames.keys())
+        max_pos = max(read_unit_filenames.keys())
+        # positions are polished independently, so run single-threaded Flye
+        # on num_threads positions at a time
+        Parallel(n_jobs=self.params.num_threads, backend='threading')(
+            delayed(polish_pos)(pos) for pos in range(min_pos, max_pos + 1))
+
     def read_polishing(self, read_unit_filenames):
         min_pos = min(read_unit_filenames.keys())
         max_pos = max(read_unit_filenames.keys())
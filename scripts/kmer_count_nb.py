@@ -0,0 +1,178 @@
+# (c) 2019 by Authors
+# This file is a part of centroFlye program.
+# Released under the BSD license (see LICENSE file)
+
+import argparse
+
+import numpy as np
+from numba import njit
+
+# 2-bit encoding of nucleotides: A=0, C=1, G=2, T=3.
+# Any other symbol (e.g. N) is encoded as N_CODE and breaks k-mers.
+N_CODE = 4
+MAX_K = 31
+
+nucl2code = np.full(256, N_CODE, dtype=np.uint8)
+for code, bases in enumerate(['Aa', 'Cc', 'Gg', 'Tt']):
+    for base in bases:
+        nucl2code[ord(base)] = code
+
+
+def kmer_len(value):
+    # argparse type for k-mer sizes supported by the 2-bit encoding
+    k = int(value)
+    if not 0 < k <= MAX_K:
+        raise argparse.ArgumentTypeError(
+            f'k-mer size must be in [1, {MAX_K}], got {k}')
+    return k
+
+
+def encode_seq(seq):
+    return nucl2code[np.frombuffer(seq.encode(), dtype=np.uint8)]
+
+
+def encode_kmer(codes):
+    h = 0
+    for c in codes:
+        h = (h << 2) | int(c)
+    return h
+
+
+def encode_kmers(kmers, k):
+    # k-mers of another length or with non-ACGT symbols never occur
+    # among k-mer hashes of a read, so they are skipped
+    assert 0 < k <= MAX_K
+    hashes = []
+    for kmer in kmers:
+        if len(kmer) != k:
+            continue
+        codes = encode_seq(kmer)
+        if np.any(codes == N_CODE):
+            continue
+        hashes.append(encode_kmer(codes))
+    return np.unique(np.array(hashes, dtype=np.int64))
+
+
+def decode_kmer(h, k):
+    h = int(h)
+    kmer = []
+    for _ in range(k):
+        kmer.append('ACGT'[h & 3])
+        h >>= 2
+    return ''.join(kmer[::-1])
+
+
+@njit(cache=True)
+def kmer_hashes(codes, k):
+    # rolling 2-bit hash; k <= MAX_K so that a k-mer fits into int64
+    assert 0 < k <= MAX_K
+    mask = (1 << (2 * k)) - 1
+    n = len(codes)
+    hashes = np.empty(max(n - k + 1, 0), dtype=np.int64)
+    nhashes = 0
+    h = 0
+    run_len = 0
+    for i in range(n):
+        c = codes[i]
+        if c == N_CODE:
+            h, run_len = 0, 0
+            continue
+        h = ((h << 2) | c) & mask
+        run_len += 1
+        if run_len >= k:
+            hashes[nhashes] = h
+            nhashes += 1
+    return hashes[:nhashes]
+
+
+@njit(cache=True)
+def count_values(values):
+    values = np.sort(values)
+    uniq_values = np.empty_like(values)
+    counts = np.empty(len(values), dtype=np.int64)
+    n = 0
+    for i in range(len(values)):
+        if n > 0 and uniq_values[n - 1] == values[i]:
+            counts[n - 1] += 1
+        else:
+            uniq_values[n] = values[i]
+            counts[n] = 1
+            n += 1
+    return uniq_values[:n], counts[:n]
+
+
+@njit(cache=True)
+def count_kmers(codes, k):
+    return count_values(kmer_hashes(codes, k))
+
+
+@njit(cache=True)
+def count_cloud_pairs(cloud_kmers, cloud_offsets, read_offsets, dist, nkmers):
+    # Clouds of all reads are concatenated: cloud c holds kmer indexes
+    # cloud_kmers[cloud_offsets[c]:cloud_offsets[c+1]] and read r holds
+    # clouds read_offsets[r]:read_offsets[r+1].
+    # A pair (i, j) of kmers in clouds dist apart is keyed as i * nkmers + j
+    npairs = 0
+    for r in range(len(read_offsets) - 1):
+        for c in range(read_offsets[r], read_offsets[r + 1] - dist):
+            npairs += (cloud_offsets[c + 1] - cloud_offsets[c]) * \
+                (cloud_offsets[c + dist + 1] - cloud_offsets[c + dist])
+    pairs = np.empty(npairs, dtype=np.int64)
+    n = 0
+    for r in range(len(read_offsets) - 1):
+        for c in range(read_offsets[r], read_offsets[r + 1] - dist):
+            for a in range(cloud_offsets[c], cloud_offsets[c + 1]):
+                i_index = cloud_kmers[a]
+                for b in range(cloud_offsets[c + dist],
+                               cloud_offsets[c + dist + 1]):
+                    j_index = cloud_kmers[b]
+                    if i_index != j_index:
+                        pairs[n] = i_index * nkmers + j_index
+                        n += 1
+    return count_values(pairs[:n])
+
+
+@njit(cache=True)
+def merge_kmer_counts(kmers1, counts1, kmers2, counts2, max_count):
+    # both tables are sorted by kmer; counts saturate at max_count
+    n1, n2 = len(kmers1), len(kmers2)
+    kmers = np.empty(n1 + n2, dtype=np.int64)
+    counts = np.empty(n1 + n2, dtype=counts1.dtype)
+    i, j, n = 0, 0, 0
+    while i < n1 or j < n2:
+        if j == n2 or (i < n1 and kmers1[i] < kmers2[j]):
+            kmers[n] = kmers1[i]
+            counts[n] = counts1[i]
+            i += 1
+        elif i == n1 or kmers2[j] < kmers1[i]:
+            kmers[n] = kmers2[j]
+            counts[n] = min(counts2[j], max_count)
+            j += 1
+        else:
+            kmers[n] = kmers1[i]
+            counts[n] = min(counts1[i] + counts2[j], max_count)
+            i += 1
+            j += 1
+        n += 1
+    return kmers[:n], counts[:n]
+
+
+class SaturatingKmerCounter:
+    def __init__(self, max_count):
+        self.max_count = max_count
+        self.kmers = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.min_scalar_type(max_count))
+        self.batch = []
+
+    def add(self, kmers):
+        self.batch.append(kmers)
+
+    def flush(self):
+        if len(self.batch) == 0:
+            return
+        kmers, counts = \
+            np.unique(np.concatenate(self.batch), return_counts=True)
+        self.kmers, self.counts = \
+            merge_kmer_counts(self.kmers, self.counts,
+                              kmers, counts, self.max_count)
+        self.batch = []
@@ -71,6 +71,11 @@ def cut_gaprich_reads(monoreads, max_gap=0.05, min_length=100, gap_symb='?'):
     return processed_reads, cut_cnt, total_parts_cnt
 
 
+def get_gap_cumsum(monostring, gap_symb='?'):
+    is_gap = [c == gap_symb for c in monostring]
+    return np.cumsum(np.insert(is_gap, 0, 0))
+
+
 def correct_gaps(monostrings, max_gap=0.3, nhor=1,
                  k=3, min_mult=5000,
                  gap_symb='?'):
@@ -82,21 +87,24 @@ def correct_gaps(monostrings, max_gap=0.3, nhor=1,
     hors, _ = db.get_contigs()
     hors = [min_cyclic_shift(hor) for hor in hors]
     hors.sort()
-    corrected_strings = {}
+    hors = [single_hor * i_nhor
+            for single_hor in hors
+            for i_nhor in range(1, nhor+1)]
+    match_char = set(gap_symb)
     for r_id, monostring in monostrings.items():
-        for single_hor in hors:
-            for i_nhor in range(1, nhor+1):
-                hor = single_hor * i_nhor
-                hor_len = len(hor)
-                for i in range(len(monostring)-hor_len+1):
-                    kmer = monostring[i:i+hor_len]
-                    gap_cnt = Counter(kmer)[gap_symb]
-                    if gap_cnt == 0 or gap_cnt / hor_len > max_gap:
-                        continue
-                    hd, _ = hamming_distance(kmer, hor,
-                                             match_char=set(gap_symb))
-                    if hd == 0:
-                        monostring[i:i+hor_len] = list(hor)
+        gap_cumsum = get_gap_cumsum(monostring, gap_symb=gap_symb)
+        for hor in hors:
+            hor_len = len(hor)
+            for i in range(len(monostring)-hor_len+1):
+                gap_cnt = gap_cumsum[i+hor_len] - gap_cumsum[i]
+                if gap_cnt == 0 or gap_cnt / hor_len > max_gap:
+                    continue
+                kmer = monostring[i:i+hor_len]
+                hd, _ = hamming_distance(kmer, hor, match_char=match_char)
+                if hd == 0:
+                    monostring[i:i+hor_len] = list(hor)
+                    gap_cumsum = \
+                        get_gap_cumsum(monostring, gap_symb=gap_symb)
         monostring.assert_validity()
     return monostrings
 
@@ -93,11 +93,10 @@ class NCRF_Report:
                         continue
                     # if strand is negative, we reverse the alignment but maintain information
                     # that the stand of alignment is originally negative
+                    # alignments are RC-ed below, once only the kept records remain
                     if strand == '-':
                         # strand = '+'
                         r_st, r_en = r_len - r_en, r_len - r_st
-                        r_al = RC(r_al)
-                        m_al = RC(m_al)
                     self.records[r_id] = self.NCRF_Record(r_id=r_id,
                                                           r_len=r_len,
                                                           r_al_len=r_al_len,
@@ -109,6 +108,10 @@ class NCRF_Report:
                                                           m_al_len=m_al_len,
                                                           al_score=al_score,
                                                           m_al=m_al)
+        for record in self.records.values():
+            if record.strand == '-':
+                record.r_al = RC(record.r_al)
+                record.m_al = RC(record.m_al)
         for r_id in self.positions_all_alignments:
             self.positions_all_alignments[r_id].sort()
         seen_r_ids = list(set(seen_r_ids))
@@ -3,16 +3,24 @@
 # Released under the BSD license (see LICENSE file)
 
 import math
-from collections import Counter
+
+import numpy as np
+
+from kmer_count_nb import encode_seq, kmer_hashes
 
 
 class ReadKMerCloud:
     def __init__(self, kmers, r_id):
+        # kmers[i] is a sorted int64 array of 2-bit encoded kmers
         self.r_id = r_id
         self.kmers = kmers
-        self.all_kmers = []
-        for v in self.kmers:
-            self.all_kmers += v
+        self.update_all_kmers()
+
+    def update_all_kmers(self):
+        if len(self.kmers):
+            self.all_kmers = np.concatenate(self.kmers)
+        else:
+            self.all_kmers = np.empty(0, dtype=np.int64)
 
     @classmethod
     def fromNCRF_record(cls, ncrf_record, n, k, genomic_kmers):
@@ -21,12 +29,11 @@ class ReadKMerCloud:
 
         kmer_clouds = []
         for ma in mas:
-            kmers = set()
-            r_al = ma.r_al.upper().replace('-', '')
-            for i in range(len(r_al) - k + 1):
-                r_kmer = r_al[i:i+k]
-                if r_kmer in genomic_kmers:
-                    kmers.add(r_kmer)
+            r_al = ma.r_al.replace('-', '')
+            kmers = np.unique(kmer_hashes(encode_seq(r_al), k))
+            if genomic_kmers is not None:
+                kmers = kmers[np.isin(kmers, genomic_kmers,
+                                      assume_unique=True)]
             kmer_clouds.append(kmers)
         return cls(kmers=kmer_clouds, r_id=r_id)
 
@@ -41,23 +48,25 @@ def get_reads_kmer_clouds(ncrf_report, n, k, genomic_kmers=None):
 
 
 def filter_reads_kmer_clouds(kmer_clouds, min_mult=2, max_mult=math.inf):
-    all_kmers = Counter()
-    for r_id, kmer_cloud in kmer_clouds.items():
-        for pos, kmers in enumerate(kmer_cloud.kmers):
-            for kmer in kmers:
-                all_kmers[kmer] += 1
+    all_kmers, all_kmers_cnt = \
+        np.unique(np.concatenate([np.empty(0, dtype=np.int64)] +
+                                 [kmer_cloud.all_kmers
+                                  for kmer_cloud in kmer_clouds.values()]),
+                  return_counts=True)
+    selected_kmers = \
+        all_kmers[(min_mult <= all_kmers_cnt) & (all_kmers_cnt <= max_mult)]
     for r_id, kmer_cloud in kmer_clouds.items():
         for pos, kmers in enumerate(kmer_cloud.kmers):
             kmer_clouds[r_id].kmers[pos] = \
-                set(kmer for kmer in kmers
-                    if max_mult >= all_kmers[kmer] >= min_mult)
+                kmers[np.isin(kmers, selected_kmers, assume_unique=True)]
+        kmer_cloud.update_all_kmers()
     return kmer_clouds
 
 
 def get_all_kmers(kmer_clouds):
-    all_kmers = []
-    for r_id, kmer_cloud in kmer_clouds.items():
-        all_kmers += kmer_clouds.all_kmers
+    all_kmers = np.concatenate([np.empty(0, dtype=np.int64)] +
+                               [kmer_cloud.all_kmers
+                                for kmer_cloud in kmer_clouds.values()])
     all_kmers.sort()
-    assert len(list(set(all_kmers))) == len(all_kmers)
+    assert np.all(all_kmers[1:] != all_kmers[:-1])
     return all_kmers
@@ -7,6 +7,7 @@ import os
 from collections import defaultdict
 
 from ncrf_parser import NCRF_Report
+from kmer_count_nb import encode_kmers, kmer_len
 from utils.os_utils import smart_makedirs
 from cloud_contig import CloudContig, update_mapping_scores
 from read_kmer_cloud import get_reads_kmer_clouds, filter_reads_kmer_clouds
@@ -22,7 +23,7 @@ class ReadPlacer:
             with open(params.genomic_kmers) as f:
                 for line in f:
                     kmers.append(line.strip())
-            self.genomic_kmers = set(kmers)
+            self.genomic_kmers = encode_kmers(kmers, k=params.k_cloud)
         else:
             self.genomic_kmers = None
         smart_makedirs(params.outdir)
@@ -39,43 +40,65 @@ class ReadPlacer:
                 self.cloud_contig.add_read(read_kmer_clouds, position=0)
                 print(r_id, 0, file=f)
 
+    @staticmethod
+    def get_best_placement(read_scores, min_unit, min_inters, min_prop):
+        best_score, best_position = None, None
+        for pos, score in read_scores.items():
+            score = (len(score), sum(score.values()))
+            if score[0] < min_unit or \
+                    score[0] * min_prop > score[1] or \
+                    score[1] < min_inters:
+                continue
+            if best_score is None or \
+                    (score, pos) > (best_score, best_position):
+                best_score = score
+                best_position = pos
+        return best_score, best_position
+
     def add_reads(self, reads, reads_kmer_clouds,
                   min_unit, min_inters, min_prop=3):
         kmers2pos = defaultdict(list)
         for r_id in reads:
             kmer_clouds = reads_kmer_clouds[r_id]
             for i, cloud in enumerate(kmer_clouds.kmers):
-                for kmer in cloud:
+                for kmer in cloud.tolist():
                     kmers2pos[kmer].append((r_id, i))
 
         unused_reads = set(reads)
         n_reads = len(unused_reads)
         scores = None
+        best_placements = {}
         freq_kmers = []
         for kmer in self.cloud_contig.freq_kmers:
             for pos in self.cloud_contig.kmer_positions[kmer]:
                 freq_kmers.append((kmer, pos))
         with open(self.position_outfile, 'a') as f:
             while len(unused_reads):
+                updated_reads = set()
                 scores = update_mapping_scores(self.cloud_contig, kmers2pos,
                                                freq_kmers=freq_kmers,
-                                               scores=scores)
-                best_score, best_position, best_read = (-1, -1), None, None
+                                               scores=scores,
+                                               updated_reads=updated_reads)
+                # only reads sharing a newly frequent kmer change their scores
+                for r_id in updated_reads & unused_reads:
+                    best_placements[r_id] = \
+                        self.get_best_placement(scores[r_id],
+                                                min_unit=min_unit,
+                                                min_inters=min_inters,
+                                                min_prop=min_prop)
+                best_score, best_position, best_read = (-1, -1), -1, None
                 for r_id in unused_reads:
-                    for pos in scores[r_id]:
-                        score = scores[r_id][pos]
-                        score = (len(score), sum(score.values()))
-                        if (score > best_score and
-                                score[0] >= min_unit and
-                                score[0] * min_prop <= score[1] and
-                                score[1] >= min_inters) or \
-                            (score == best_score and pos > best_position) or \
-                                (score == best_score and
-                                 pos == best_position and
-                                 r_id < best_read):
-                            best_score = score
-                            best_position = pos
-                            best_read = r_id
+                    if r_id not in best_placements:
+                        continue
+                    score, pos = best_placements[r_id]
+                    if score is None:
+                        continue
+                    if (score, pos) > (best_score, best_position) or \
+                            ((score, pos) == (best_score, best_position) and
+                             r_id < best_read):
+                        best_score = score
+                        best_position = pos
+                        best_read = r_id
                 if best_read is None:
                     print(f"Unused reads {len(unused_reads)}, {n_reads}, "
                           f"{len(unused_reads) / n_reads}")
@@ -143,7 +166,7 @@ def main():
     parser.add_argument('--k-cloud',
                         help='Size of k-mer for k-mer cloud',
                         default=19,
-                        type=int)
+                        type=kmer_len)
     parser.add_argument('--min-cloud-kmer-freq',
                         help='Minimal frequency of a kmer in the cloud',
                         default=2,
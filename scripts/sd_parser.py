@@ -3,14 +3,20 @@
 # Released under the BSD license (see LICENSE file)
 
 import argparse
+import os
 from collections import Counter
 from string import ascii_uppercase, ascii_lowercase
 
 import numpy as np
 import pandas as pd
+from joblib import Memory
 
 from utils.bio import read_bio_seqs, compress_homopolymer
 
+# Part of the cache key of load_sd_report.
+# Bump it when parsing of SD reports or MonoString changes.
+SD_REPORT_CACHE_VERSION = 1
+
 
 class MonoString:
     def __init__(self, name,
@@ -178,20 +184,53 @@ class SD_Report:
                                 'score',
                                 'reliability'
                                 ])
-        df.monomer = df.monomer.apply(lambda x: self.monomer_names_map[x])
-        df = df.groupby('r_id')
-        for r_id, group in df:
+        unknown = ~df.monomer.isin(list(self.monomer_names_map))
+        if unknown.any():
+            unknown_monomers = df.monomer[unknown].unique().tolist()
+            raise ValueError(f'Unknown monomers: {unknown_monomers}')
+        df.monomer = df.monomer.map(self.monomer_names_map)
+        monomers = df.monomer.to_numpy()
+        starts = df.r_st.to_numpy()
+        ends = df.r_en.to_numpy()
+        reliabilities = df.reliability.to_numpy()
+        r_id_indexes = df.groupby('r_id').indices
+        for r_id in sorted(r_id_indexes):
+            indexes = r_id_indexes[r_id]
+            reliability = reliabilities[indexes].tolist()
             self.monostrings[r_id] = \
                 MonoString.FromSDRecord(name=r_id,
-                                        monomers=group.monomer.to_list(),
-                                        starts=group.r_st.to_list(),
-                                        ends=group.r_en.to_list(),
-                                        reliability=group.reliability.to_list(),
+                                        monomers=monomers[indexes].tolist(),
+                                        starts=starts[indexes].tolist(),
+                                        ends=ends[indexes].tolist(),
+                                        reliability=reliability,
                                         max_gap=max_gap,
                                         mean_monomer_len=mean_monomer_len,
                                         gap_symb=self.gap_symb)
 
 
+def _read_sd_report(SD_report_fn, monomers_fn, max_gap, gap_symb,
+                    mtimes, version):
+    # mtimes and version are not used here but invalidate the cache
+    # when inputs or the parser change
+    return SD_Report(SD_report_fn=SD_report_fn,
+                     monomers_fn=monomers_fn,
+                     max_gap=max_gap,
+                     gap_symb=gap_symb)
+
+
+def load_sd_report(SD_report_fn, monomers_fn, max_gap=100, gap_symb='?',
+                   cachedir=None):
+    # cachedir=None disables caching
+    memory = Memory(location=cachedir, verbose=0)
+    mtimes = (os.path.getmtime(SD_report_fn), os.path.getmtime(monomers_fn))
+    return memory.cache(_read_sd_report)(SD_report_fn=SD_report_fn,
+                                         monomers_fn=monomers_fn,
+                                         max_gap=max_gap,
+                                         gap_symb=gap_symb,
+                                         mtimes=mtimes,
+                                         version=SD_REPORT_CACHE_VERSION)
+
+
 def get_ngap_symbols(monostrings, compr_hmp=False, gap_symb='?'):
     cnt = 0
     for monostring in monostrings.values():
@@ -233,8 +272,12 @@ def main():
                         "--monomers",
                         help="Fasta with monomers",
                         required=True)
+    parser.add_argument("--cachedir",
+                        help="Directory to cache the parsed report in "
+                             "(no caching by default)")
     params = parser.parse_args()
-    sd_report = SD_Report(params.input, params.monomers)
+    sd_report = load_sd_report(params.input, params.monomers,
+                               cachedir=params.cachedir)
     get_stats(monostrings=sd_report.get_monomer_strings(),
               verbose=True, return_stats=False)
 
@@ -14,15 +14,15 @@ from utils.bio import read_bio_seqs, compress_homopolymer
 
 class SD_Report:
     class SD_Record:
-        def __init__(self, r_id, pandas_df,
+        def __init__(self, r_id, monomers, r_st, r_en, score, alt_call,
                      max_gap, mean_monomer_len, gap_symb):
             self.r_id = r_id
-            self.monomers = pandas_df.monomer.to_list()
-            self.r_st = pandas_df.r_st.to_list()
-            self.r_en = pandas_df.r_en.to_list()
+            self.monomers = monomers
+            self.r_st = r_st
+            self.r_en = r_en
             self.triples = list(zip(self.monomers, self.r_st, self.r_en))
-            self.score = pandas_df.score.to_list()
-            self.alt_call = pandas_df.alt_call.to_list()
+            self.score = score
+            self.alt_call = alt_call
 
             self.string = \
                 [self.monomers[0][0] if self.alt_call[0] == 'None'
@@ -76,11 +76,24 @@ class SD_Report:
                                 'alt_call',
                                 'alt_score'
                                 ])
-        df.monomer = df.monomer.apply(lambda x: self.monomer_names_map[x])
-        df = df.groupby('r_id')
-        for r_id, group in df:
+        unknown = ~df.monomer.isin(list(self.monomer_names_map))
+        if unknown.any():
+            unknown_monomers = df.monomer[unknown].unique().tolist()
+            raise ValueError(f'Unknown monomers: {unknown_monomers}')
+        df.monomer = df.monomer.map(self.monomer_names_map)
+        columns = {column: df[column].to_numpy()
+                   for column in ['monomer', 'r_st', 'r_en',
+                                  'score', 'alt_call']}
+        r_id_indexes = df.groupby('r_id').indices
+        for r_id in sorted(r_id_indexes):
+            indexes = r_id_indexes[r_id]
             self.records[r_id] = \
-                self.SD_Record(r_id, group,
+                self.SD_Record(r_id,
+                               monomers=columns['monomer'][indexes].tolist(),
+                               r_st=columns['r_st'][indexes].tolist(),
+                               r_en=columns['r_en'][indexes].tolist(),
+                               score=columns['score'][indexes].tolist(),
+                               alt_call=columns['alt_call'][indexes].tolist(),
                                max_gap=max_gap,
                                mean_monomer_len=mean_monomer_len,
                                gap_symb=self.gap_symb)